@@ -1,20 +1,32 @@
 import asyncio
-import json
+import functools
 import logging
 import os
+import time
 from contextlib import suppress
-from datetime import datetime, timedelta
 
-from aiogram import Bot, Dispatcher, F, types
+import msgspec
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, types
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
 from aiogram.enums import ChatType
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.filters import CommandStart, Command, StateFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import CopyMessage, ForwardMessage, SendMessage, SendPhoto
 from aiogram.types import (Message, InlineKeyboardButton, InlineKeyboardMarkup,
-                           CallbackQuery, ChatMemberUpdated)
+                           CallbackQuery, ChatMemberUpdated, ErrorEvent)
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
+from msgspec import Struct
+
+try:
+    import uvloop
+except ImportError:  # uvloop не работает на Windows — там остаётся стандартный цикл asyncio
+    uvloop = None
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -22,35 +34,373 @@ logging.basicConfig(level=logging.INFO)
 bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode="HTML"))
 dp = Dispatcher()
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
+# Если WEBHOOK_URL не задан, бот работает через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = 100
 DATA_FILE = "bot_data.json"
+EVENTS_FILE = "bot_events.jsonl"
+FLUSH_DELAY = 0.2
+FLUSH_RETRY_DELAY = 5
+COMPACT_EVERY = 1000
+MAX_CONCURRENT_UPDATES = 256
+MAX_UPDATES_PER_CHAT = 8  # больше в очереди одного чата не держим, чтобы он не занял все слоты
+INVITE_LINK_TTL = 600
+CALLBACK_DEDUP_WINDOW = 0.5
+SEND_RATE = 28  # сообщений в секунду, с запасом до глобального лимита Telegram в 30
+
+
+class Settings(Struct):
+    reviews_locked: bool = False
+    review_timeout_seconds: int = 0
+    review_limit: int = 1  # сколько отзывов можно оставить за review_timeout_seconds
+
+
+class Review(Struct):
+    user_id: int
+    username: str | None
+    first_name: str
+    text: str
+    photo_file_id: str | None = None
+
+
+class Group(Struct):
+    id: int
+    title: str
+
+
+class BotData(Struct, dict=True, omit_defaults=True):
+    pending_reviews: dict[int, Review] = {}
+    groups: list[Group] = []
+    main_group_id: int | None = None
+    settings: Settings = msgspec.field(default_factory=Settings)
+    # Скользящее окно по минутам: [(номер минуты, число отзывов), ...] от старых к новым
+    user_review_buckets: dict[int, list[tuple[int, int]]] = {}
+    # Старый формат снимка: время последнего отзыва; при загрузке переносится в user_review_buckets
+    user_last_review_time: dict[int, float] = {}
+
+    def __post_init__(self):
+        # Индекс групп по id; в файл не сохраняется, поддерживается вместе со списком
+        self.groups_by_id = {g.id: g for g in self.groups}
+        for user_id, ts in self.user_last_review_time.items():
+            self.user_review_buckets.setdefault(user_id, [(int(ts // 60), 1)])
+        self.user_last_review_time = {}
+
+
+class Event(Struct, tag_field='op'):
+    # Изменение bot_data для журнала; каждый подкласс применяет себя в apply(data)
+    pass
+
+
+class AddReview(Event, tag='add_review'):
+    id: int
+    review: Review
+
+    def apply(self, data):
+        data.pending_reviews[self.id] = self.review
+
+
+class RemoveReview(Event, tag='remove_review'):
+    id: int
+
+    def apply(self, data):
+        data.pending_reviews.pop(self.id, None)
+
+
+class ReviewBuckets(Event, tag='review_buckets'):
+    user_id: int
+    buckets: list[tuple[int, int]]
+
+    def apply(self, data):
+        data.user_review_buckets[self.user_id] = self.buckets
+
+
+class AddGroup(Event, tag='add_group'):
+    group: Group
+
+    def apply(self, data):
+        if self.group.id not in data.groups_by_id:
+            data.groups.append(self.group)
+            data.groups_by_id[self.group.id] = self.group
+
+
+class RemoveGroup(Event, tag='remove_group'):
+    id: int
+
+    def apply(self, data):
+        if data.groups_by_id.pop(self.id, None):
+            data.groups = [g for g in data.groups if g.id != self.id]
+        if data.main_group_id == self.id: data.main_group_id = None
+
+
+class SetMainGroup(Event, tag='set_main_group'):
+    id: int
+
+    def apply(self, data):
+        data.main_group_id = self.id
+
+
+class SetSetting(Event, tag='set_setting'):
+    key: str
+    value: bool | int
+
+    def apply(self, data):
+        setattr(data.settings, self.key, self.value)
+
+
+event_decoder = msgspec.json.Decoder(
+    AddReview | RemoveReview | ReviewBuckets | AddGroup | RemoveGroup | SetMainGroup | SetSetting)
+event_encoder = msgspec.json.Encoder()
 
 
 def load_data():
     try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        data = {}
+        with open(DATA_FILE, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        raw = b""
+
+    data = BotData()
+    if raw.strip():
+        try:
+            data = msgspec.json.decode(raw, type=BotData)
+        except msgspec.DecodeError:
+            # Не затираем нечитаемый снимок пустым состоянием: откладываем его в сторону для ручного разбора
+            broken_file = f"{DATA_FILE}.broken-{int(time.time())}"
+            os.replace(DATA_FILE, broken_file)
+            logging.exception("Не удалось прочитать %s, файл перемещён в %s", DATA_FILE, broken_file)
+
+    replayed = 0
+    good_offset = 0
+    with suppress(FileNotFoundError), open(EVENTS_FILE, 'r+b') as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise msgspec.DecodeError("строка без перевода строки")
+                event_decoder.decode(line).apply(data)
+                replayed += 1
+            except msgspec.ValidationError as e:
+                # Корректный JSON, но неизвестное событие: пропускаем только его
+                logging.warning("Пропущена запись журнала %s (%s): %r", EVENTS_FILE, e, line)
+            except msgspec.DecodeError:
+                # Недописанная строка после падения: обрезаем журнал, иначе новые события приклеятся к ней
+                f.seek(0, os.SEEK_END)
+                logging.warning("Журнал %s обрезан с %d до %d байт, отброшен хвост: %r",
+                                EVENTS_FILE, f.tell(), good_offset, line[:200])
+                f.truncate(good_offset)
+                break
+            good_offset += len(line)
+    return data, replayed
+
+
+def _save_data_sync(data):
+    # Пишем во временный файл и подменяем им основной: при падении останется старый снимок, а не обрывок.
+    # fsync сознательно не делаем — потеря последних секунд отзывов при сбое питания допустима
+    tmp_file = DATA_FILE + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(msgspec.json.encode(data))
+    os.replace(tmp_file, DATA_FILE)
+    # Снимок уже содержит всё из журнала, поэтому журнал начинается заново
+    events_log.seek(0)
+    events_log.truncate()
+
+
+async def save_data(data):
+    await asyncio.to_thread(_save_data_sync, data)
+
+
+def _append_events_sync(events):
+    events_log.write(event_encoder.encode_lines(events))
+    events_log.flush()
+
+
+bot_data, events_since_compact = load_data()
+events_log = open(EVENTS_FILE, 'ab')
+pending_events = []
+dirty_event = asyncio.Event()
+
+
+def mark_dirty():
+    dirty_event.set()
+
+
+def commit_event(event: Event):
+    event.apply(bot_data)
+    pending_events.append(event)
+    keyboard_cache.clear()
+    mark_dirty()
+
+
+# Клавиатуры админки, собранные из текущего состояния; сбрасываются при любом изменении bot_data
+keyboard_cache = {}
+
+
+def cached_keyboard(key: str, build):
+    keyboard = keyboard_cache.get(key)
+    if keyboard is None:
+        keyboard = keyboard_cache[key] = build()
+    return keyboard
+
+
+async def flush_events():
+    global events_since_compact
+    events = pending_events[:]
+    pending_events.clear()
+    try:
+        if events_since_compact + len(events) >= COMPACT_EVERY:
+            await save_data(bot_data)
+            events_since_compact = 0
+        elif events:
+            await asyncio.to_thread(_append_events_sync, events)
+            events_since_compact += len(events)
+    except Exception:
+        # В журнале мог остаться обрывок записи, поэтому следующая попытка перепишет снимок целиком
+        pending_events[:0] = events
+        events_since_compact = COMPACT_EVERY
+        raise
+
+
+async def flusher():
+    # Собираем изменения за FLUSH_DELAY в одну запись, чтобы не писать файл на каждое нажатие
+    while True:
+        await dirty_event.wait()
+        await asyncio.sleep(FLUSH_DELAY)
+        dirty_event.clear()
+        try:
+            await flush_events()
+        except Exception:
+            logging.exception("Не удалось сохранить данные, повтор через %s с", FLUSH_RETRY_DELAY)
+            await asyncio.sleep(FLUSH_RETRY_DELAY)
+            mark_dirty()
+
+
+def _live_buckets(user_id: int, now: float):
+    window = bot_data.settings.review_timeout_seconds
+    return [(m, c) for m, c in bot_data.user_review_buckets.get(user_id, ()) if (m + 1) * 60 + window > now]
+
+
+def review_cooldown(user_id: int, now: float) -> int:
+    # Сколько секунд ждать до следующего отзыва; 0 — можно писать сейчас
+    settings = bot_data.settings
+    if settings.review_timeout_seconds <= 0:
+        return 0
+    buckets = _live_buckets(user_id, now)
+    excess = sum(c for _, c in buckets) - settings.review_limit + 1
+    if excess <= 0:
+        return 0
+    for minute, count in buckets:
+        excess -= count
+        if excess <= 0:
+            return int((minute + 1) * 60 + settings.review_timeout_seconds - now)
+    return 0
+
+
+def record_review(user_id: int, now: float):
+    minute = int(now // 60)
+    buckets = _live_buckets(user_id, now)
+    if buckets and buckets[-1][0] == minute:
+        buckets[-1] = (minute, buckets[-1][1] + 1)
+    else:
+        buckets.append((minute, 1))
+    commit_event(ReviewBuckets(user_id=user_id, buckets=buckets))
+
+
+background_tasks = set()
+
+
+def run_in_background(coro):
+    # Держим ссылку на задачу, иначе сборщик мусора может убрать её до завершения
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendRateLimitMiddleware(BaseRequestMiddleware):
+    # Лимит Telegram считается по всем отправленным сообщениям сразу, поэтому ограничиваем на уровне сессии:
+    # сюда попадают и bot.send_message, и message.answer, и answer_photo
+    limited_methods = (SendMessage, SendPhoto, ForwardMessage, CopyMessage)
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, self.limited_methods):
+            await self.bucket.acquire()
+        return await make_request(bot, method)
 
-    data.setdefault('pending_reviews', {})
-    data.setdefault('groups', [])
-    data.setdefault('main_group_id', None)
-    data.setdefault('settings', {
-        'reviews_locked': False,
-        'review_timeout_seconds': 0
-    })
-    data.setdefault('user_last_review_time', {})
 
-    data['pending_reviews'] = {int(k): v for k, v in data['pending_reviews'].items()}
-    return data
+bot.session.middleware(SendRateLimitMiddleware(TokenBucket(SEND_RATE)))
 
 
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+async def notify_user(user_id: int, text: str):
+    with suppress(TelegramBadRequest, TelegramForbiddenError):
+        await bot.send_message(user_id, text)
 
 
-bot_data = load_data()
+async def _do_approve(review_id: int, review: Review, group_id: int):
+    try:
+        await bot.forward_message(chat_id=group_id, from_chat_id=review.user_id, message_id=review_id)
+    except Exception as e:
+        commit_event(AddReview(id=review_id, review=review))
+        await notify_user(ADMIN_ID, f"❌ Ошибка пересылки отзыва от {review.first_name}: {e}")
+        return
+    await notify_user(review.user_id, "✅ Ваш отзыв одобрен и опубликован!")
+
+
+invite_links = {}  # id группы -> (ссылка, время получения)
+invite_link_fetches = {}  # id группы -> задача, которая сейчас получает ссылку
+
+
+async def _fetch_invite_link(group_id: int):
+    try:
+        chat = await bot.get_chat(group_id)
+        invite_link = chat.invite_link or (await bot.export_chat_invite_link(group_id))
+    except Exception:
+        return None
+    invite_links[group_id] = (invite_link, time.monotonic())
+    return invite_link
+
+
+def fetch_invite_link(group_id: int) -> asyncio.Task:
+    # Параллельные export_chat_invite_link отзывают ссылки друг друга, поэтому на группу — не больше одного запроса
+    task = invite_link_fetches.get(group_id)
+    if task is None:
+        task = invite_link_fetches[group_id] = asyncio.create_task(_fetch_invite_link(group_id))
+        task.add_done_callback(lambda _: invite_link_fetches.pop(group_id, None))
+    return task
+
+
+def cached_invite_link(group_id: int):
+    entry = invite_links.get(group_id)
+    if entry and time.monotonic() - entry[1] < INVITE_LINK_TTL:
+        return entry[0]
+    return None
+
+
+async def prefetch_invite_links():
+    await asyncio.gather(*(fetch_invite_link(g.id) for g in bot_data.groups if not cached_invite_link(g.id)))
 
 
 class ReviewState(StatesGroup):
@@ -61,11 +411,93 @@ class AdminState(StatesGroup):
     waiting_for_rejection_reason = State()
 
 
+class ReviewCB(CallbackData, prefix="rv"):
+    action: str
+    review_id: int
+
+
+class GroupCB(CallbackData, prefix="gr"):
+    action: str
+    group_id: int
+
+
+class TimeoutCB(CallbackData, prefix="to"):
+    seconds: int
+
+
+class LimitCB(CallbackData, prefix="lim"):
+    limit: int
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    # Повторное нажатие той же кнопки тем же пользователем в пределах окна отбрасывается.
+    # Стоит перед ChatOrderMiddleware, чтобы дубликаты не ждали в очереди чата
+    def __init__(self, window: float):
+        self.window = window
+        self.recent = {}
+        self.last_prune = time.monotonic()
+
+    async def __call__(self, handler, event, data):
+        query = event.callback_query
+        if query is None:
+            return await handler(event, data)
+        now = time.monotonic()
+        key = (query.from_user.id, query.data)
+        last = self.recent.get(key)
+        if last is not None and now - last < self.window:
+            return None
+        if now - self.last_prune > self.window:
+            # Не чаще раза за окно, чтобы при наплыве нажатий не перебирать словарь на каждом обновлении
+            self.recent = {k: t for k, t in self.recent.items() if now - t < self.window}
+            self.last_prune = now
+        self.recent[key] = now
+        return await handler(event, data)
+
+
+class ChatOrderMiddleware(BaseMiddleware):
+    # Обновления одного чата идут строго по очереди, разные чаты обрабатываются параллельно
+    def __init__(self, max_queued: int):
+        self.max_queued = max_queued
+        self.locks = {}
+        self.queued = {}
+
+    async def __call__(self, handler, event, data):
+        chat = data.get('event_chat')
+        if chat is None:
+            return await handler(event, data)
+        queued = self.queued.get(chat.id, 0)
+        if queued >= self.max_queued:
+            logging.info("Чат %s: в очереди уже %s обновлений, обновление %s отброшено",
+                         chat.id, queued, event.update_id)
+            return None
+        self.queued[chat.id] = queued + 1
+        lock = self.locks.get(chat.id)
+        if lock is None:
+            lock = self.locks[chat.id] = asyncio.Lock()
+        try:
+            async with lock:
+                # FSMContextMiddleware прочитал состояние до очереди; перечитываем то, что оставил предыдущий апдейт
+                state = data.get('state')
+                if state is not None:
+                    data['raw_state'] = await state.get_state()
+                return await handler(event, data)
+        finally:
+            self.queued[chat.id] -= 1
+            if not self.queued[chat.id]:
+                del self.queued[chat.id]
+                del self.locks[chat.id]
+
+
+dp.update.outer_middleware(CallbackDedupMiddleware(CALLBACK_DEDUP_WINDOW))
+dp.update.outer_middleware(ChatOrderMiddleware(MAX_UPDATES_PER_CHAT))
+
+
+TIMEOUT_LABELS = {0: "Отключен", 86400: "1 день", 172800: "2 дня", 604800: "1 неделя"}
+
+
 def humanize_time(seconds: int) -> str:
-    if seconds == 0: return "Отключен"
-    if seconds == 86400: return "1 день"
-    if seconds == 172800: return "2 дня"
-    if seconds == 604800: return "1 неделя"
+    label = TIMEOUT_LABELS.get(seconds)
+    if label is not None: return label
     days = seconds // 86400
     hours = (seconds % 86400) // 3600
     minutes = (seconds % 3600) // 60
@@ -74,14 +506,17 @@ def humanize_time(seconds: int) -> str:
     return f"{minutes} мин."
 
 
+MAIN_MENU_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✍️ Оставить отзыв", callback_data="leave_review")]
+])
+
+
 def get_main_menu_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✍️ Оставить отзыв", callback_data="leave_review")]
-    ])
+    return MAIN_MENU_KB
 
 
-def get_admin_panel_keyboard():
-    reviews_count = len(bot_data['pending_reviews'])
+def _build_admin_panel_keyboard():
+    reviews_count = len(bot_data.pending_reviews)
     reviews_text = f"📋 Модерация ({reviews_count})" if reviews_count > 0 else "📋 Модерация"
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=reviews_text, callback_data="admin_moderate_reviews")],
@@ -90,6 +525,47 @@ def get_admin_panel_keyboard():
     ])
 
 
+def get_admin_panel_keyboard():
+    return cached_keyboard("admin_panel", _build_admin_panel_keyboard)
+
+
+def _review_row(item):
+    review_id, review = item
+    return [InlineKeyboardButton(text=f"От {review.first_name}{' 🖼️' if review.photo_file_id else ''}",
+                                 callback_data=ReviewCB(action="open", review_id=review_id).pack())]
+
+
+def _build_pending_reviews_keyboard():
+    buttons = list(map(_review_row, bot_data.pending_reviews.items()))
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def _group_row(g):
+    return [InlineKeyboardButton(text=f"{g.title}{' ⭐' if g.id == bot_data.main_group_id else ''}",
+                                 callback_data=GroupCB(action="open", group_id=g.id).pack())]
+
+
+def _build_groups_keyboard():
+    buttons = list(map(_group_row, bot_data.groups))
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def _build_restrictions_keyboard():
+    settings = bot_data.settings
+    timeout_text = f"⏳ Тайм-аут: {humanize_time(settings.review_timeout_seconds)}"
+    lock_text = "✅ Разблокировать отправку" if settings.reviews_locked else "❌ Заблокировать отправку"
+    lock_callback = "confirm_unlock" if settings.reviews_locked else "confirm_lock"
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=timeout_text, callback_data="restrictions_timeout")],
+        [InlineKeyboardButton(text=f"🔢 Отзывов за тайм-аут: {settings.review_limit}", callback_data="restrictions_limit")],
+        [InlineKeyboardButton(text=lock_text, callback_data=lock_callback)],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")]
+    ])
+
+
+@functools.lru_cache(maxsize=32)
 def get_back_keyboard(back_to: str):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔙 Назад", callback_data=back_to)]
@@ -128,18 +604,14 @@ async def back_to_admin_panel(callback: CallbackQuery, state: FSMContext):
 async def start_review(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
 
-    if bot_data['settings']['reviews_locked']:
+    if bot_data.settings.reviews_locked:
         return await callback.answer("⛔ Прием отзывов временно приостановлен администратором.", show_alert=True)
 
-    timeout_seconds = bot_data['settings']['review_timeout_seconds']
-    if user_id != ADMIN_ID and timeout_seconds > 0:
-        last_review_timestamp = bot_data['user_last_review_time'].get(str(user_id))
-        if last_review_timestamp:
-            elapsed = datetime.now().timestamp() - last_review_timestamp
-            if elapsed < timeout_seconds:
-                remaining_seconds = int(timeout_seconds - elapsed)
-                return await callback.answer(
-                    f"Вы сможете оставить следующий отзыв через {humanize_time(remaining_seconds)}.", show_alert=True)
+    if user_id != ADMIN_ID:
+        remaining_seconds = review_cooldown(user_id, time.time())
+        if remaining_seconds > 0:
+            return await callback.answer(
+                f"Вы сможете оставить следующий отзыв через {humanize_time(remaining_seconds)}.", show_alert=True)
 
     await callback.message.edit_text(
         "Напишите ваш отзыв (от 10 до 50 символов).\n\n"
@@ -157,16 +629,14 @@ async def process_review(message: Message, state: FSMContext):
         "❌ Ошибка: текст отзыва (или подпись к фото) должен содержать от 10 до 50 символов.")
 
     review_id = message.message_id
-    bot_data['pending_reviews'][review_id] = {
-        'user_id': message.from_user.id,
-        'username': message.from_user.username,
-        'first_name': message.from_user.first_name,
-        'text': text,
-        'photo_file_id': message.photo[-1].file_id if message.photo else None
-    }
-
-    bot_data['user_last_review_time'][str(message.from_user.id)] = datetime.now().timestamp()
-    save_data(bot_data)
+    commit_event(AddReview(id=review_id, review=Review(
+        user_id=message.from_user.id,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name,
+        text=text,
+        photo_file_id=message.photo[-1].file_id if message.photo else None
+    )))
+    record_review(message.from_user.id, time.time())
     await state.clear()
 
     await bot.send_message(ADMIN_ID, f"🔔 Новый отзыв на модерацию от @{message.from_user.username}.")
@@ -182,74 +652,66 @@ async def show_pending_reviews(callback: CallbackQuery, state: FSMContext):
         await callback.message.delete()
         message_to_edit = await callback.message.answer("👀 Отзывы на модерации:")
 
-    if not bot_data['pending_reviews']:
+    if not bot_data.pending_reviews:
         await callback.answer("✅ Нет отзывов для модерации.", show_alert=True)
         return await message_to_edit.edit_text("⚙️ Админ-панель", reply_markup=get_admin_panel_keyboard())
 
-    buttons = [[InlineKeyboardButton(text=f"От {review['first_name']}{' 🖼️' if review.get('photo_file_id') else ''}",
-                                     callback_data=f"review_{review_id}")] for review_id, review in
-               bot_data['pending_reviews'].items()]
-    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")])
     await message_to_edit.edit_text("👀 Отзывы на модерации:",
-                                    reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+                                    reply_markup=cached_keyboard("pending_reviews", _build_pending_reviews_keyboard))
 
 
-@dp.callback_query(F.data.startswith("review_"))
-async def moderate_review(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(ReviewCB.filter(F.action == "open"))
+async def moderate_review(callback: CallbackQuery, callback_data: ReviewCB, state: FSMContext):
     await state.clear()
-    review_id = int(callback.data.split("_")[1])
-    review = bot_data['pending_reviews'].get(review_id)
+    review_id = callback_data.review_id
+    review = bot_data.pending_reviews.get(review_id)
     if not review:
         await callback.answer("Этот отзыв уже был обработан.", show_alert=True)
         return await show_pending_reviews(callback, state)
 
-    caption_text = f"<b>Отзыв от {review['first_name']}</b> (@{review['username'] or 'N/A'})\n\n<i>\"{review['text']}\"</i>"
+    caption_text = f"<b>Отзыв от {review.first_name}</b> (@{review.username or 'N/A'})\n\n<i>\"{review.text}\"</i>"
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{review_id}"),
-         InlineKeyboardButton(text="❌ Отказать", callback_data=f"reject_{review_id}")],
+        [InlineKeyboardButton(text="✅ Одобрить", callback_data=ReviewCB(action="approve", review_id=review_id).pack()),
+         InlineKeyboardButton(text="❌ Отказать", callback_data=ReviewCB(action="reject", review_id=review_id).pack())],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_moderate_reviews")]
     ])
 
-    if review.get('photo_file_id'):
+    if review.photo_file_id:
         await callback.message.delete()
-        await callback.message.answer_photo(photo=review['photo_file_id'], caption=caption_text, reply_markup=keyboard)
+        await callback.message.answer_photo(photo=review.photo_file_id, caption=caption_text, reply_markup=keyboard)
     else:
         await callback.message.edit_text(caption_text, reply_markup=keyboard)
     await callback.answer()
 
 
-@dp.callback_query(F.data.startswith("approve_"))
-async def approve_review(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(ReviewCB.filter(F.action == "approve"))
+async def approve_review(callback: CallbackQuery, callback_data: ReviewCB, state: FSMContext):
     await state.clear()
-    review_id = int(callback.data.split("_")[1])
-    review = bot_data['pending_reviews'].pop(review_id, None)
+    review_id = callback_data.review_id
+    review = bot_data.pending_reviews.get(review_id)
     if not review: return await callback.answer("Этот отзыв уже был обработан.", show_alert=True)
+    commit_event(RemoveReview(id=review_id))
 
-    if not bot_data['main_group_id']:
+    if not bot_data.main_group_id:
         await callback.answer("⚠️ Основная группа не выбрана!", show_alert=True)
-        await bot.send_message(review['user_id'], "✅ Ваш отзыв одобрен!")
+        run_in_background(notify_user(review.user_id, "✅ Ваш отзыв одобрен!"))
     else:
-        try:
-            await bot.forward_message(chat_id=bot_data['main_group_id'], from_chat_id=review['user_id'],
-                                      message_id=review_id)
-            await bot.send_message(review['user_id'], "✅ Ваш отзыв одобрен и опубликован!")
-            await callback.answer("✅ Отзыв переслан в группу!", show_alert=True)
-        except Exception as e:
-            await callback.answer(f"❌ Ошибка пересылки: {e}", show_alert=True)
-            bot_data['pending_reviews'][review_id] = review
-
-    save_data(bot_data)
+        run_in_background(_do_approve(review_id, review, bot_data.main_group_id))
+        await callback.answer("✅ Отзыв отправлен в группу!", show_alert=True)
+
     await show_pending_reviews(callback, state)
 
 
-@dp.callback_query(F.data.startswith("reject_") & F.data.split("_")[1].isdigit())
-async def reject_review_confirm(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(ReviewCB.filter(F.action == "reject"))
+async def reject_review_confirm(callback: CallbackQuery, callback_data: ReviewCB, state: FSMContext):
     await state.clear()
-    review_id = int(callback.data.split("_")[1])
+    review_id = callback_data.review_id
     buttons = [
-        [InlineKeyboardButton(text="Без причины", callback_data=f"reject_final_noreason_{review_id}")],
-        [InlineKeyboardButton(text="Указать причину", callback_data=f"reject_final_reason_{review_id}")],
-        [InlineKeyboardButton(text="🔙 Отмена", callback_data=f"review_{review_id}")]
+        [InlineKeyboardButton(text="Без причины",
+                              callback_data=ReviewCB(action="reject_noreason", review_id=review_id).pack())],
+        [InlineKeyboardButton(text="Указать причину",
+                              callback_data=ReviewCB(action="reject_reason", review_id=review_id).pack())],
+        [InlineKeyboardButton(text="🔙 Отмена", callback_data=ReviewCB(action="open", review_id=review_id).pack())]
     ]
     message_to_use = callback.message
     if callback.message.photo:
@@ -261,27 +723,27 @@ async def reject_review_confirm(callback: CallbackQuery, state: FSMContext):
                                        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
 
 
-@dp.callback_query(F.data.startswith("reject_final_noreason_"))
-async def reject_final_noreason(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(ReviewCB.filter(F.action == "reject_noreason"))
+async def reject_final_noreason(callback: CallbackQuery, callback_data: ReviewCB, state: FSMContext):
     await state.clear()
-    review_id = int(callback.data.split("_")[-1])
-    review = bot_data['pending_reviews'].pop(review_id, None)
+    review_id = callback_data.review_id
+    review = bot_data.pending_reviews.get(review_id)
     if not review: return await callback.answer("Отзыв уже обработан.", show_alert=True)
-    with suppress(TelegramBadRequest): await bot.send_message(review['user_id'],
-                                                              "❌ К сожалению, ваш отзыв был отклонен.")
-    save_data(bot_data)
+    commit_event(RemoveReview(id=review_id))
+    run_in_background(notify_user(review.user_id, "❌ К сожалению, ваш отзыв был отклонен."))
     await callback.answer("Отзыв отклонен.", show_alert=True)
     await show_pending_reviews(callback, state)
 
 
-@dp.callback_query(F.data.startswith("reject_final_reason_"))
-async def reject_final_reason_prompt(callback: CallbackQuery, state: FSMContext):
-    review_id = int(callback.data.split("_")[-1])
+@dp.callback_query(ReviewCB.filter(F.action == "reject_reason"))
+async def reject_final_reason_prompt(callback: CallbackQuery, callback_data: ReviewCB, state: FSMContext):
+    review_id = callback_data.review_id
     await state.set_state(AdminState.waiting_for_rejection_reason)
     await state.update_data(review_id_to_reject=review_id)
     await callback.message.edit_text("Напишите причину отказа. Она будет отправлена пользователю.",
                                      reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                                         [InlineKeyboardButton(text="🔙 Отмена", callback_data=f"review_{review_id}")]]))
+                                         [InlineKeyboardButton(text="🔙 Отмена", callback_data=ReviewCB(
+                                             action="open", review_id=review_id).pack())]]))
 
 
 @dp.message(AdminState.waiting_for_rejection_reason, F.text)
@@ -289,61 +751,57 @@ async def process_rejection_reason(message: Message, state: FSMContext):
     data = await state.get_data();
     review_id = data.get('review_id_to_reject');
     reason = message.text
-    review = bot_data['pending_reviews'].pop(review_id, None)
+    review = bot_data.pending_reviews.get(review_id)
     await state.clear()
     if not review: await message.answer("Отзыв уже был обработан."); return
-    with suppress(TelegramBadRequest): await bot.send_message(review['user_id'],
-                                                              f"❌ К сожалению, ваш отзыв был отклонен.\n<b>Причина:</b> {reason}")
-    save_data(bot_data)
+    commit_event(RemoveReview(id=review_id))
+    run_in_background(notify_user(review.user_id,
+                                  f"❌ К сожалению, ваш отзыв был отклонен.\n<b>Причина:</b> {reason}"))
     await message.answer("✅ Причина отправлена, отзыв отклонен.")
     await cmd_admin(message, state)
 
 
 @dp.callback_query(F.data == "admin_my_groups")
 async def show_my_groups(callback: CallbackQuery):
-    if not bot_data['groups']: return await callback.message.edit_text(
+    if not bot_data.groups: return await callback.message.edit_text(
         "Бот пока не состоит ни в одной группе.\nЧтобы добавить группу, просто сделайте его администратором в ней.",
         reply_markup=get_back_keyboard("admin_panel"))
-    buttons = [[InlineKeyboardButton(text=f"{g['title']}{' ⭐' if g['id'] == bot_data.get('main_group_id') else ''}",
-                                     callback_data=f"group_{g['id']}")] for g in bot_data['groups']]
-    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")])
-    await callback.message.edit_text("👥 Мои группы:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    await callback.message.edit_text("👥 Мои группы:", reply_markup=cached_keyboard("groups", _build_groups_keyboard))
+    # Пока админ смотрит список, заранее получаем ссылки, чтобы открытие группы не ждало двух запросов
+    run_in_background(prefetch_invite_links())
 
 
-@dp.callback_query(F.data.startswith("group_"))
-async def group_options(callback: CallbackQuery):
-    group_id = int(callback.data.split("_")[1])
-    group = next((g for g in bot_data['groups'] if g['id'] == group_id), None)
+@dp.callback_query(GroupCB.filter(F.action == "open"))
+async def group_options(callback: CallbackQuery, callback_data: GroupCB):
+    group_id = callback_data.group_id
+    group = bot_data.groups_by_id.get(group_id)
     if not group: return await callback.answer("Группа не найдена.", show_alert=True)
-    try:
-        chat = await bot.get_chat(group_id);
-        invite_link = chat.invite_link or (await bot.export_chat_invite_link(group_id))
-    except Exception:
-        invite_link = None
-    main_button_text = "⭐ Основная" if group_id == bot_data.get('main_group_id') else "Сделать основной"
+    invite_link = cached_invite_link(group_id) or (await asyncio.shield(fetch_invite_link(group_id)))
+    main_button_text = "⭐ Основная" if group_id == bot_data.main_group_id else "Сделать основной"
     buttons = [
         [InlineKeyboardButton(text="➡️ Открыть группу", url=invite_link)] if invite_link else [],
-        [InlineKeyboardButton(text=main_button_text, callback_data=f"setmain_{group_id}")],
+        [InlineKeyboardButton(text=main_button_text, callback_data=GroupCB(action="setmain", group_id=group_id).pack())],
         # <<< ИЗМЕНЕНИЕ: Кнопка ведет на подтверждение >>>
-        [InlineKeyboardButton(text="🗑️ Удалить и выйти", callback_data=f"confirm_delete_{group_id}")],
+        [InlineKeyboardButton(text="🗑️ Удалить и выйти",
+                              callback_data=GroupCB(action="confirm_delete", group_id=group_id).pack())],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_my_groups")]
     ]
-    await callback.message.edit_text(f"Группа: <b>{group['title']}</b>",
+    await callback.message.edit_text(f"Группа: <b>{group.title}</b>",
                                      reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
 
 
-@dp.callback_query(F.data.startswith("confirm_delete_"))  # <<< Новая логика подтверждения
-async def confirm_delete_group(callback: CallbackQuery):
-    group_id = int(callback.data.split("_")[-1])
-    buttons = [[InlineKeyboardButton(text="✅ Да, выйти", callback_data=f"delete_final_{group_id}"),
-                InlineKeyboardButton(text="❌ Нет, отмена", callback_data=f"group_{group_id}")]]
+@dp.callback_query(GroupCB.filter(F.action == "confirm_delete"))  # <<< Новая логика подтверждения
+async def confirm_delete_group(callback: CallbackQuery, callback_data: GroupCB):
+    group_id = callback_data.group_id
+    buttons = [[InlineKeyboardButton(text="✅ Да, выйти", callback_data=GroupCB(action="delete", group_id=group_id).pack()),
+                InlineKeyboardButton(text="❌ Нет, отмена", callback_data=GroupCB(action="open", group_id=group_id).pack())]]
     await callback.message.edit_text("Вы уверены, что хотите, чтобы бот покинул эту группу?",
                                      reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
 
 
-@dp.callback_query(F.data.startswith("delete_final_"))  # <<< Финальное удаление
-async def delete_and_leave_group(callback: CallbackQuery):
-    group_id = int(callback.data.split("_")[-1])
+@dp.callback_query(GroupCB.filter(F.action == "delete"))  # <<< Финальное удаление
+async def delete_and_leave_group(callback: CallbackQuery, callback_data: GroupCB):
+    group_id = callback_data.group_id
     try:
         await bot.leave_chat(group_id);
         await callback.answer("Бот покинул группу.", show_alert=True)
@@ -352,55 +810,64 @@ async def delete_and_leave_group(callback: CallbackQuery):
     await show_my_groups(callback)
 
 
-@dp.callback_query(F.data.startswith("setmain_"))
-async def set_main_group(callback: CallbackQuery):
-    group_id = int(callback.data.split("_")[1])
-    if bot_data.get('main_group_id') == group_id: return await callback.answer("Эта группа уже является основной.",
+@dp.callback_query(GroupCB.filter(F.action == "setmain"))
+async def set_main_group(callback: CallbackQuery, callback_data: GroupCB):
+    group_id = callback_data.group_id
+    if bot_data.main_group_id == group_id: return await callback.answer("Эта группа уже является основной.",
                                                                                show_alert=True)
-    bot_data['main_group_id'] = group_id
-    save_data(bot_data)
+    commit_event(SetMainGroup(id=group_id))
     await callback.answer("⭐ Основная группа успешно изменена!", show_alert=True)
     await show_my_groups(callback)
 
 
 @dp.callback_query(F.data == "admin_restrictions")
 async def admin_restrictions_menu(callback: CallbackQuery):
-    settings = bot_data['settings']
-    timeout_text = f"⏳ Тайм-аут: {humanize_time(settings['review_timeout_seconds'])}"
-    lock_text = "✅ Разблокировать отправку" if settings['reviews_locked'] else "❌ Заблокировать отправку"
-    lock_callback = "confirm_unlock" if settings['reviews_locked'] else "confirm_lock"
-
-    buttons = [
-        [InlineKeyboardButton(text=timeout_text, callback_data="restrictions_timeout")],
-        [InlineKeyboardButton(text=lock_text, callback_data=lock_callback)],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")]
-    ]
     await callback.message.edit_text("⚙️ Настройка ограничений",
-                                     reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+                                     reply_markup=cached_keyboard("restrictions", _build_restrictions_keyboard))
+
+
+TIMEOUT_MENU_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="1 день", callback_data=TimeoutCB(seconds=86400).pack()),
+     InlineKeyboardButton(text="2 дня", callback_data=TimeoutCB(seconds=172800).pack())],
+    [InlineKeyboardButton(text="1 неделя", callback_data=TimeoutCB(seconds=604800).pack()),
+     InlineKeyboardButton(text="Отключить", callback_data=TimeoutCB(seconds=0).pack())],
+    [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_restrictions")]
+])
 
 
 @dp.callback_query(F.data == "restrictions_timeout")
 async def restrictions_timeout_menu(callback: CallbackQuery):
-    buttons = [
-        [InlineKeyboardButton(text="1 день", callback_data="set_timeout_86400"),
-         InlineKeyboardButton(text="2 дня", callback_data="set_timeout_172800")],
-        [InlineKeyboardButton(text="1 неделя", callback_data="set_timeout_604800"),
-         InlineKeyboardButton(text="Отключить", callback_data="set_timeout_0")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_restrictions")]
-    ]
     await callback.message.edit_text("⏳ Выберите тайм-аут между отзывами для одного пользователя:",
-                                     reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+                                     reply_markup=TIMEOUT_MENU_KB)
 
 
-@dp.callback_query(F.data.startswith("set_timeout_"))
-async def set_timeout(callback: CallbackQuery):
-    seconds = int(callback.data.split("_")[-1])
-    bot_data['settings']['review_timeout_seconds'] = seconds
-    save_data(bot_data)
+@dp.callback_query(TimeoutCB.filter())
+async def set_timeout(callback: CallbackQuery, callback_data: TimeoutCB):
+    seconds = callback_data.seconds
+    commit_event(SetSetting(key='review_timeout_seconds', value=seconds))
     await callback.answer(f"Тайм-аут установлен: {humanize_time(seconds)}", show_alert=True)
     await admin_restrictions_menu(callback)
 
 
+LIMIT_MENU_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=str(limit), callback_data=LimitCB(limit=limit).pack()) for limit in (1, 2, 3, 5)],
+    [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_restrictions")]
+])
+
+
+@dp.callback_query(F.data == "restrictions_limit")
+async def restrictions_limit_menu(callback: CallbackQuery):
+    await callback.message.edit_text("🔢 Сколько отзывов один пользователь может оставить за время тайм-аута?",
+                                     reply_markup=LIMIT_MENU_KB)
+
+
+@dp.callback_query(LimitCB.filter())
+async def set_limit(callback: CallbackQuery, callback_data: LimitCB):
+    commit_event(SetSetting(key='review_limit', value=callback_data.limit))
+    await callback.answer(f"Лимит установлен: {callback_data.limit}", show_alert=True)
+    await admin_restrictions_menu(callback)
+
+
 @dp.callback_query(F.data.in_({"confirm_lock", "confirm_unlock"}))
 async def confirm_lock_unlock(callback: CallbackQuery):
     action = "заблокировать" if callback.data == "confirm_lock" else "разблокировать"
@@ -413,8 +880,7 @@ async def confirm_lock_unlock(callback: CallbackQuery):
 @dp.callback_query(F.data.in_({"final_заблокировать", "final_разблокировать"}))
 async def final_lock_unlock(callback: CallbackQuery):
     is_locking = callback.data == "final_заблокировать"
-    bot_data['settings']['reviews_locked'] = is_locking
-    save_data(bot_data)
+    commit_event(SetSetting(key='reviews_locked', value=is_locking))
     await callback.answer(f"Прием отзывов {'заблокирован' if is_locking else 'разблокирован'}!", show_alert=True)
     await admin_restrictions_menu(callback)
 
@@ -423,24 +889,75 @@ async def final_lock_unlock(callback: CallbackQuery):
 async def on_chat_member_updated(update: ChatMemberUpdated):
     if update.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]: return
     chat_id, new_status, title = update.chat.id, update.new_chat_member.status, update.chat.title
-    is_in_list = any(g['id'] == chat_id for g in bot_data['groups'])
+    is_in_list = chat_id in bot_data.groups_by_id
 
     if new_status in ("administrator", "member") and not is_in_list:
-        bot_data['groups'].append({'id': chat_id, 'title': title})
+        commit_event(AddGroup(group=Group(id=chat_id, title=title)))
         await bot.send_message(ADMIN_ID, f"ℹ️ Бот был добавлен в группу: <b>{title}</b>")
     elif new_status in ("left", "kicked") and is_in_list:
-        bot_data['groups'] = [g for g in bot_data['groups'] if g['id'] != chat_id]
-        if bot_data.get('main_group_id') == chat_id: bot_data['main_group_id'] = None
+        commit_event(RemoveGroup(id=chat_id))
         await bot.send_message(ADMIN_ID, f"ℹ️ Бот был удален из группы: <b>{title}</b>")
 
-    save_data(bot_data)
+
+@dp.errors()
+async def on_error(event: ErrorEvent):
+    # Ошибку только логируем: в режиме вебхука необработанное исключение превратилось бы в HTTP 500,
+    # и Telegram стал бы присылать то же обновление снова
+    logging.error("Ошибка при обработке обновления %s", event.update.update_id, exc_info=event.exception)
+    return True
+
+
+flusher_task = None
+
+
+@dp.startup()
+async def on_startup():
+    global flusher_task
+    flusher_task = asyncio.create_task(flusher())
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                              max_connections=WEBHOOK_MAX_CONNECTIONS,
+                              allowed_updates=dp.resolve_used_update_types())
+
+
+@dp.shutdown()
+async def on_shutdown():
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    flusher_task.cancel()
+    await asyncio.gather(flusher_task, return_exceptions=True)
+    await save_data(bot_data)
+    events_log.close()
+
+
+async def run_webhook():
+    app = web.Application()
+    # Ответ Telegram отдаём после обработки: число одновременных обновлений ограничено max_connections вебхука
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET,
+                         handle_in_background=False).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
 
 
 async def main():
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    if WEBHOOK_URL:
+        await run_webhook()
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot, handle_as_tasks=True, tasks_concurrency_limit=MAX_CONCURRENT_UPDATES,
+                               allowed_updates=dp.resolve_used_update_types())
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if uvloop:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
 